@@ -1,22 +1,36 @@
 import os
 import logging
+import functools
+import math
 import pandas as pd
+import numpy as np
 import xlrd
 from datetime import datetime, timedelta
 import re
 import yaml
-import qrcode
+import charset_normalizer
+import codecs
+import segno
 from PIL import Image, ImageDraw
 import io
-from flask import Flask, render_template, request, jsonify, send_file, flash, redirect, url_for, session
+import shutil
+import tempfile
+from flask import Flask, Request, render_template, request, jsonify, send_file, flash, redirect, url_for, session
 from werkzeug.utils import secure_filename
 from werkzeug.middleware.proxy_fix import ProxyFix
 import pypdf
+import pypdfium2 as pdfium
+from pypdf.generic import ArrayObject, ContentStream, DecodedStreamObject, DictionaryObject, NameObject, RectangleObject
+from reportlab import rl_config
 from reportlab.pdfgen import canvas
 from reportlab.lib.pagesizes import letter
-import tempfile
+from reportlab.lib.utils import ImageReader
 import time
 import threading
+import itertools
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
 from datetime import datetime, timedelta
 from dateutil import parser as date_parser
 
@@ -29,6 +43,8 @@ app.wsgi_app = ProxyFix(app.wsgi_app, x_proto=1, x_host=1)
 UPLOAD_FOLDER = 'uploads'
 OUTPUT_FOLDER = 'output'
 ALLOWED_EXTENSIONS = {'csv', 'xls', 'xlsx'}
+TEMPLATE_FORM_NAME = '/ParkingPassTemplate'
+DEFAULT_CONFIRMATION_REGEX = r"Conf[:#]?\s*(\d+)"
 
 os.makedirs(UPLOAD_FOLDER, exist_ok=True)
 os.makedirs(OUTPUT_FOLDER, exist_ok=True)
@@ -36,17 +52,49 @@ os.makedirs(OUTPUT_FOLDER, exist_ok=True)
 app.config['UPLOAD_FOLDER'] = UPLOAD_FOLDER
 app.config['OUTPUT_FOLDER'] = OUTPUT_FOLDER
 app.config['MAX_CONTENT_LENGTH'] = 16 * 1024 * 1024  # 16MB max file size
+UPLOAD_CHUNK_SIZE = 1024 * 1024  # 1MB copy buffer for uploads
+CSV_CHUNK_SIZE = 50000  # Rows per chunk when reading CSV files
+ENCODING_SAMPLE_SIZE = 64 * 1024  # Bytes sampled for CSV encoding detection
+PARALLEL_PDF_MIN_ROWS = 200  # Smaller batches render faster in a single process
+PDF_CHUNK_ROWS = 16  # Rows per worker task (8 pages of two passes)
+PARALLEL_PDF_MAX_WORKERS = 4  # Worker cap per request, so concurrent gunicorn requests don't oversubscribe the CPU
+
+# PDF workers start from a fork server instead of forking this multi-threaded process. The server
+# preloads the heavy libraries but not this module, whose import would start a cleanup thread there
+PDF_MP_CONTEXT = multiprocessing.get_context('forkserver')
+PDF_MP_CONTEXT.set_forkserver_preload(['flask', 'numpy', 'pandas', 'pypdf', 'reportlab.pdfgen.canvas', 'segno', 'yaml'])
+
+TEMPLATE_BACKGROUND_DPI = 150  # Resolution of the pre-rendered template background
+TEMPLATE_BACKGROUND_QUALITY = 90  # JPEG quality of the pre-rendered template background
+RL_CONFIG_LOCK = threading.Lock()  # Serialises temporary changes to ReportLab's process-wide rl_config
+
+class UploadRequest(Request):
+    """Request that spools uploaded files into the upload folder instead of /tmp"""
+    
+    def _get_file_stream(self, total_content_length, content_type, filename=None, content_length=None):
+        # Small uploads stay in memory, as with Werkzeug's default stream factory
+        if total_content_length is not None and total_content_length <= 500 * 1024:
+            return io.BytesIO()
+        return tempfile.NamedTemporaryFile('wb+', dir=app.config['UPLOAD_FOLDER'], prefix='.upload_', suffix='.part')
+
+app.request_class = UploadRequest
 
 # Load configuration files
+@functools.lru_cache(maxsize=1)
 def load_config():
     """Load column mapping and date format configuration"""
     try:
         with open('config.yml', 'r') as f:
-            return yaml.safe_load(f)
+            config = yaml.safe_load(f)
     except FileNotFoundError:
         logging.error("config.yml not found, using default configuration")
-        return get_default_config()
+        config = get_default_config()
+    
+    # Compile the confirmation regex once instead of on every row
+    config['confirmation_pattern'] = re.compile(config.get('confirmation_regex', DEFAULT_CONFIRMATION_REGEX))
+    return config
 
+@functools.lru_cache(maxsize=1)
 def load_layout():
     """Load layout configuration for PDF positioning"""
     try:
@@ -66,7 +114,7 @@ def get_default_config():
         },
         'date_format_in': ["%m/%d/%y", "%m/%d/%Y", "%Y-%m-%d", "%d/%m/%Y"],
         'date_format_out': "%m/%d/%Y",
-        'confirmation_regex': r"Conf[:#]?\s*(\d+)"
+        'confirmation_regex': DEFAULT_CONFIRMATION_REGEX
     }
 
 def get_default_layout():
@@ -96,16 +144,48 @@ def allowed_file(filename):
     """Check if file extension is allowed"""
     return '.' in filename and filename.rsplit('.', 1)[1].lower() in ALLOWED_EXTENSIONS
 
+def detect_encoding(filepath):
+    """Guess the text encoding of a file from a sample of its bytes"""
+    with open(filepath, 'rb') as f:
+        sample = f.read(ENCODING_SAMPLE_SIZE)
+    
+    # Only trust UTF-16/32 when the file says so with a byte order mark
+    if sample.startswith(codecs.BOM_UTF8):
+        return 'utf-8-sig'
+    if sample.startswith((codecs.BOM_UTF32_LE, codecs.BOM_UTF32_BE)):
+        return 'utf-32'
+    if sample.startswith((codecs.BOM_UTF16_LE, codecs.BOM_UTF16_BE)):
+        return 'utf-16'
+    
+    # Strict UTF-8 first; the sample may end partway through a multi-byte character
+    try:
+        codecs.getincrementaldecoder('utf-8')().decode(sample, final=False)
+        return 'utf-8'
+    except UnicodeDecodeError:
+        pass
+    
+    # Otherwise choose between the single-byte encodings spreadsheet exports actually use
+    match = charset_normalizer.from_bytes(sample, cp_isolation=['cp1252', 'latin_1']).best()
+    if match is None or match.encoding.startswith(('utf_16', 'utf_32')):
+        return None
+    return match.encoding
+
 def load_table(filepath):
     """Load CSV or XLS file into pandas DataFrame"""
     try:
         file_ext = filepath.rsplit('.', 1)[1].lower()
         
         if file_ext == 'csv':
-            # Try different encodings for CSV
-            for encoding in ['utf-8', 'utf-8-sig', 'iso-8859-1', 'cp1252']:
+            # Try the detected encoding first, then fall back to common ones
+            detected = detect_encoding(filepath)
+            fallbacks = ['utf-8', 'utf-8-sig', 'iso-8859-1', 'cp1252']
+            encodings = [detected] + [e for e in fallbacks if e != detected] if detected else fallbacks
+            for encoding in encodings:
                 try:
-                    df = pd.read_csv(filepath, encoding=encoding)
+                    # Read in chunks, dropping blank rows as we go to bound peak memory
+                    with pd.read_csv(filepath, encoding=encoding, chunksize=CSV_CHUNK_SIZE) as reader:
+                        chunks = [chunk.dropna(axis=0, how='all') for chunk in reader]
+                    df = pd.concat(chunks, ignore_index=True)
                     logging.info(f"Successfully loaded CSV with {encoding} encoding")
                     break
                 except UnicodeDecodeError:
@@ -122,26 +202,24 @@ def load_table(filepath):
             raw_df = pd.read_excel(filepath, engine=engine, header=None)
             logging.info(f"Raw Excel data shape: {raw_df.shape}")
             
-            # Look for the header row by finding rows with meaningful header text
+            # Look for the header row by finding rows with meaningful header text.
+            # Convert the whole sheet to text once rather than row by row
+            header_keywords = ['guest', 'name', 'status', 'arrive', 'depart', 'room', 'rate', 'type']
+            cells = raw_df.astype(str).apply(lambda col: col.str.strip())
+            non_empty = ~cells.isin(['', 'nan', 'NaN'])
+            row_text = cells.where(non_empty, '').agg(' '.join, axis=1).str.lower()
+            keyword_matches = sum(row_text.str.contains(keyword, regex=False).astype(int) for keyword in header_keywords)
+            
+            # Need at least 5 non-empty columns and at least 3 header keywords
+            header_candidates = np.flatnonzero((non_empty.sum(axis=1) >= 5) & (keyword_matches >= 3))
             header_row = 0
-            for i in range(len(raw_df)):  # Check all rows
-                row_data = raw_df.iloc[i].astype(str).str.strip()
-                non_empty_vals = [val for val in row_data if val and val != 'nan' and val != 'NaN' and val != '']
-                
-                # If this row has multiple non-empty values, check if it's headers
-                if len(non_empty_vals) >= 5:  # Need at least 5 columns for headers
-                    row_text = ' '.join(non_empty_vals).lower()
-                    header_keywords = ['guest', 'name', 'status', 'arrive', 'depart', 'room', 'rate', 'type']
-                    
-                    keyword_matches = sum(1 for keyword in header_keywords if keyword in row_text)
-                    
-                    if keyword_matches >= 3:  # Need at least 3 header keywords
-                        header_row = i
-                        logging.info(f"Found header row at index {i}: {non_empty_vals[:10]}")
-                        break
+            if len(header_candidates):
+                header_row = int(header_candidates[0])
+                non_empty_vals = cells.iloc[header_row][non_empty.iloc[header_row]].tolist()
+                logging.info(f"Found header row at index {header_row}: {non_empty_vals[:10]}")
             
-            # Load with the detected header row
-            df = pd.read_excel(filepath, engine=engine, header=header_row)
+            # Build the frame from the rows already in memory instead of parsing the workbook again
+            df = frame_from_header_row(raw_df, header_row)
             
             # If we still have unnamed columns, try to use the data from a different row as headers
             if all(col.startswith('Unnamed:') for col in df.columns if isinstance(col, str)):
@@ -181,56 +259,101 @@ def load_table(filepath):
         logging.error(f"Error loading file {filepath}: {str(e)}")
         raise
 
+def frame_from_header_row(raw_df, header_row):
+    """Turn a header-less sheet into a DataFrame using the given row as column names"""
+    columns = []
+    seen = set()
+    for position, name in enumerate(raw_df.iloc[header_row]):
+        if pd.isna(name) or str(name).strip() == '':
+            name = f"Unnamed: {position}"
+        elif isinstance(name, float) and name.is_integer():
+            # Numeric columns store header cells like 2025 as floats; name them as read_excel(header=N) would
+            name = int(name)
+        
+        # De-duplicate repeated headers the same way pandas does ("Rate", "Rate.1", ...)
+        candidate = name
+        suffix = 0
+        while candidate in seen:
+            suffix += 1
+            candidate = f"{name}.{suffix}"
+        seen.add(candidate)
+        columns.append(candidate)
+    
+    df = raw_df.iloc[header_row + 1:].reset_index(drop=True)
+    df.columns = columns
+    
+    # Data columns were read alongside header text, so re-infer their dtypes
+    return df.infer_objects()
+
+def table_cache_path(filepath):
+    """Path of the parsed DataFrame cached next to an uploaded file"""
+    return filepath + '.pkl'
+
+def load_cached_table(filepath):
+    """Load an uploaded file, reusing the parsed DataFrame from a previous request"""
+    cache_path = table_cache_path(filepath)
+    
+    if os.path.exists(cache_path) and os.path.getmtime(cache_path) >= os.path.getmtime(filepath):
+        try:
+            return pd.read_pickle(cache_path)
+        except Exception as e:
+            logging.warning(f"Could not read cached table {cache_path}: {e}")
+    
+    df = load_table(filepath)
+    
+    # Cache the parsed result so later steps skip header detection and post-processing
+    try:
+        df.to_pickle(cache_path)
+    except Exception as e:
+        logging.warning(f"Could not cache parsed table {cache_path}: {e}")
+    
+    return df
+
 def process_visual_matrix_format(df):
     """Process Visual Matrix specific format where confirmation numbers are on separate rows"""
     try:
-        processed_rows = []
-        
-        for i, row in df.iterrows():
-            # Check if this is a guest data row (has guest name)
-            guest_name_col = None
-            for col in df.columns:
-                if 'Guest' in str(col) or 'Name' in str(col):
-                    guest_name_col = col
-                    break
-            
-            if guest_name_col and pd.notna(row[guest_name_col]) and ',' in str(row[guest_name_col]):
-                # This is a guest row, look for confirmation number in the next row
-                guest_data = row.copy()
-                
-                # Look ahead for confirmation number in next few rows
-                conf_num = None
-                for look_ahead in range(1, 4):  # Check next 3 rows
-                    if i + look_ahead < len(df):
-                        next_row = df.iloc[i + look_ahead]
-                        # Convert all values to strings and look for Conf:
-                        row_values = [str(val).strip() for val in next_row if pd.notna(val)]
-                        
-                        for j, val in enumerate(row_values):
-                            if val == 'Conf:' and j + 1 < len(row_values):
-                                # Next value should be the confirmation number
-                                potential_conf = row_values[j + 1].strip()
-                                # Remove any non-alphanumeric characters for validation
-                                clean_conf = ''.join(c for c in potential_conf if c.isalnum() or c in '-')
-                                if clean_conf and len(clean_conf) >= 3:  # Must be at least 3 chars
-                                    conf_num = clean_conf
-                                    logging.info(f"Found confirmation number: {conf_num}")
-                                    break
-                        
-                        if conf_num:
-                            break
-                
-                # Add confirmation number to guest data
-                if conf_num:
-                    guest_data['Confirmation'] = conf_num
-                else:
-                    guest_data['Confirmation'] = 'Not Found'
-                
-                processed_rows.append(guest_data)
+        # Identify the guest name column once, up front
+        guest_name_col = next((col for col in df.columns if 'Guest' in str(col) or 'Name' in str(col)), None)
+        if guest_name_col is None:
+            logging.warning("No guest records found in Visual Matrix format")
+            return df
+        
+        guest_names = df[guest_name_col]
+        guest_mask = (guest_names.notna() & guest_names.astype(str).str.contains(',', regex=False)).to_numpy()
+        
+        # Locate every "Conf:" cell in a single pass over the whole sheet
+        cells = df.astype(str).apply(lambda col: col.str.strip()).to_numpy()
+        present = df.notna().to_numpy()
+        conf_cells = present & (cells == 'Conf:')
+        
+        # The confirmation number is the next non-empty cell to the right of "Conf:"
+        n_rows, n_cols = present.shape
+        positions = np.where(present, np.arange(n_cols), n_cols)
+        next_present = np.minimum.accumulate(positions[:, ::-1], axis=1)[:, ::-1]
+        next_present = np.hstack([next_present[:, 1:], np.full((n_rows, 1), n_cols)])
         
-        if processed_rows:
-            result_df = pd.DataFrame(processed_rows)
-            logging.info(f"Processed Visual Matrix format: {len(result_df)} guest records")
+        # np.nonzero walks row-major, so the leftmost usable "Conf:" in each row wins
+        row_conf = [None] * n_rows
+        for row, col in zip(*np.nonzero(conf_cells)):
+            value_col = next_present[row, col]
+            if row_conf[row] is not None or value_col >= n_cols:
+                continue
+            # Remove any non-alphanumeric characters for validation
+            clean_conf = ''.join(c for c in cells[row, value_col] if c.isalnum() or c in '-')
+            if clean_conf and len(clean_conf) >= 3:  # Must be at least 3 chars
+                row_conf[row] = clean_conf
+        
+        # Each guest takes the confirmation number from the nearest of the next 3 rows
+        row_conf = pd.Series(row_conf, dtype=object)
+        guest_conf = row_conf.shift(-1)
+        for look_ahead in range(2, 4):
+            guest_conf = guest_conf.combine_first(row_conf.shift(-look_ahead))
+        
+        if guest_mask.any():
+            result_df = df[guest_mask].infer_objects()
+            result_df['Confirmation'] = guest_conf[guest_mask].fillna('Not Found').to_numpy()
+            found = int(guest_conf[guest_mask].notna().sum())
+            logging.info(f"Processed Visual Matrix format: {len(result_df)} guest records, {found} confirmation numbers found")
             return result_df
         else:
             logging.warning("No guest records found in Visual Matrix format")
@@ -242,15 +365,21 @@ def process_visual_matrix_format(df):
 
 def auto_map_columns(df, config):
     """Automatically map DataFrame columns to required fields"""
-    columns = df.columns.tolist()
+    columns_lower = pd.Series(df.columns).astype(str).str.lower()
     mapping = {}
     
     for field, possible_names in config['columns'].items():
-        for col_name in columns:
-            if any(possible.lower() in col_name.lower() for possible in possible_names):
-                mapping[field] = col_name
-                logging.info(f"Auto-mapped '{field}' to column '{col_name}'")
-                break
+        # An empty alias list would join to a pattern that matches every column
+        if not possible_names:
+            continue
+        
+        # Match all aliases for this field against every column name at once
+        pattern = '|'.join(re.escape(possible.lower()) for possible in possible_names)
+        matches = columns_lower.str.contains(pattern, regex=True)
+        if matches.any():
+            col_name = df.columns[matches.idxmax()]
+            mapping[field] = col_name
+            logging.info(f"Auto-mapped '{field}' to column '{col_name}'")
     
     return mapping
 
@@ -275,26 +404,31 @@ def parse_date(date_str, date_formats):
     except:
         return None
 
-def compute_nights(arrival, departure):
-    """Compute number of nights between arrival and departure"""
-    if not arrival or not departure:
-        return None
+def parse_date_column(values, date_formats):
+    """Parse a column of date values, trying each format across the whole column"""
+    text = values.astype(str).str.strip().where(values.notna())
     
-    try:
-        if isinstance(arrival, str):
-            arrival = parse_date(arrival, load_config()['date_format_in'])
-        if isinstance(departure, str):
-            departure = parse_date(departure, load_config()['date_format_in'])
-            
-        if not arrival or not departure:
-            return None
-            
-        nights = (departure - arrival).days
-        return nights if nights > 0 else None
+    # pandas reads 'now' and 'today' as the current time whatever the format; leave them to parse_date
+    format_text = text.mask(text.str.lower().isin(['now', 'today']))
+    
+    # Earlier formats win, matching the order parse_date tries them in
+    parsed = pd.Series(pd.NaT, index=values.index, dtype='datetime64[ns]')
+    for fmt in date_formats:
+        parsed = parsed.combine_first(pd.to_datetime(format_text, format=fmt, errors='coerce'))
+    
+    # Only cells no configured format matched go through the dateutil fallback
+    unparsed = parsed.isna() & text.notna() & (text != '')
+    for idx in unparsed[unparsed].index:
+        fallback = parse_date(text[idx], [])
+        if not fallback:
+            continue
         
-    except Exception as e:
-        logging.error(f"Error computing nights: {e}")
-        return None
+        # Dates pandas can't hold, like 12/31/9999 placeholders, are reported as invalid
+        fallback = fallback.replace(tzinfo=None)
+        if pd.Timestamp.min <= fallback <= pd.Timestamp.max:
+            parsed[idx] = pd.Timestamp(fallback)
+    
+    return parsed
 
 def validate_rows(df, column_mapping, config):
     """Validate DataFrame rows and return errors/warnings"""
@@ -305,57 +439,64 @@ def validate_rows(df, column_mapping, config):
     arrival_col = column_mapping.get('arrival')
     departure_col = column_mapping.get('departure')
     
-    for idx, row in df.iterrows():
-        row_errors = []
-        
-        # Validate confirmation number
-        conf_num = None
-        if conf_col and not pd.isna(row[conf_col]):
-            conf_num = str(row[conf_col]).strip()
-            if not conf_num:
-                # Try regex fallback
-                full_row_text = ' '.join([str(val) for val in row.values if not pd.isna(val)])
-                match = re.search(config.get('confirmation_regex', r"Conf[:#]?\s*(\d+)"), full_row_text)
-                if match:
-                    conf_num = match.group(1)
-                else:
-                    row_errors.append("Missing or invalid confirmation number")
-        else:
-            row_errors.append("Missing confirmation number column")
-        
-        # Validate and parse dates
-        arrival_date = None
-        departure_date = None
-        nights = None
-        
-        if arrival_col and not pd.isna(row[arrival_col]):
-            arrival_date = parse_date(row[arrival_col], config['date_format_in'])
-            if not arrival_date:
-                row_errors.append("Invalid arrival date format")
-        else:
-            row_errors.append("Missing arrival date")
-            
-        if departure_col and not pd.isna(row[departure_col]):
-            departure_date = parse_date(row[departure_col], config['date_format_in'])
-            if not departure_date:
-                row_errors.append("Invalid departure date format")
+    # Work positionally so column operations never depend on index alignment
+    row_labels = df.index.tolist()
+    df = df.reset_index(drop=True)
+    no_value = pd.Series(None, index=df.index, dtype=object)
+    
+    conf_values = df[conf_col] if conf_col else no_value
+    conf_missing = conf_values.isna().to_numpy()
+    confirmations = conf_values.astype(str).str.strip().where(~conf_missing, None).tolist()
+    
+    # Blank confirmation cells fall back to a regex over the rest of the row
+    conf_pattern = config.get('confirmation_pattern') or re.compile(config.get('confirmation_regex', DEFAULT_CONFIRMATION_REGEX))
+    conf_invalid = np.zeros(len(df), dtype=bool)
+    for pos in [pos for pos, conf_num in enumerate(confirmations) if conf_num == '']:
+        full_row_text = ' '.join([str(val) for val in df.iloc[pos] if not pd.isna(val)])
+        match = conf_pattern.search(full_row_text)
+        if match:
+            confirmations[pos] = match.group(1)
         else:
-            row_errors.append("Missing departure date")
-        
-        if arrival_date and departure_date:
-            nights = compute_nights(arrival_date, departure_date)
-            if nights is None or nights <= 0:
-                row_errors.append("Invalid stay duration (must be positive)")
+            conf_invalid[pos] = True
+    
+    # Parse both date columns in bulk
+    arrival_values = df[arrival_col] if arrival_col else no_value
+    departure_values = df[departure_col] if departure_col else no_value
+    arrival_dates = parse_date_column(arrival_values, config['date_format_in'])
+    departure_dates = parse_date_column(departure_values, config['date_format_in'])
+    
+    stay_days = (departure_dates - arrival_dates).dt.days
+    both_dates = arrival_dates.notna() & departure_dates.notna()
+    nights = [int(days) if days > 0 else None for days in stay_days.fillna(0)]
+    arrival_out = arrival_dates.dt.strftime(config['date_format_out']).fillna('').tolist()
+    departure_out = departure_dates.dt.strftime(config['date_format_out']).fillna('').tolist()
+    
+    # One boolean column per check, in the order errors are reported
+    checks = [
+        (conf_missing, "Missing confirmation number column"),
+        (conf_invalid, "Missing or invalid confirmation number"),
+        (arrival_values.isna(), "Missing arrival date"),
+        (arrival_values.notna() & arrival_dates.isna(), "Invalid arrival date format"),
+        (departure_values.isna(), "Missing departure date"),
+        (departure_values.notna() & departure_dates.isna(), "Invalid departure date format"),
+        (both_dates & ~(stay_days > 0), "Invalid stay duration (must be positive)"),
+    ]
+    failed = np.column_stack([np.asarray(flags, dtype=bool) for flags, _ in checks])
+    messages = [message for _, message in checks]
+    has_errors = failed.any(axis=1)
+    
+    # Only the summary fields are materialised per row; the full row stays in the DataFrame
+    for pos, row_label in enumerate(row_labels):
+        row_errors = [messages[check] for check in np.flatnonzero(failed[pos])] if has_errors[pos] else []
         
         row_data = {
-            'index': idx,
-            'confirmation': conf_num,
-            'arrival': arrival_date.strftime(config['date_format_out']) if arrival_date else '',
-            'departure': departure_date.strftime(config['date_format_out']) if departure_date else '',
-            'nights': nights,
+            'index': row_label,
+            'confirmation': confirmations[pos],
+            'arrival': arrival_out[pos],
+            'departure': departure_out[pos],
+            'nights': nights[pos],
             'errors': row_errors,
-            'valid': len(row_errors) == 0,
-            'raw_data': row.to_dict()
+            'valid': not has_errors[pos]
         }
         
         if row_errors:
@@ -365,16 +506,22 @@ def validate_rows(df, column_mapping, config):
     
     return valid_rows, errors
 
-def generate_qr_code(content, size=100):
-    """Generate QR code image"""
-    qr = qrcode.QRCode(version=1, box_size=10, border=5)
-    qr.add_data(content)
-    qr.make(fit=True)
+@functools.lru_cache(maxsize=512)
+def generate_qr_code(content, size=100, border=5, error_correction='M'):
+    """Generate QR code as PNG bytes, cached by content, size and style"""
+    # A fixed mask skips scoring all 8 mask patterns. The chosen mask only affects
+    # how evenly dark and light modules are spread, which doesn't matter for
+    # short printed payloads like these
+    qr = segno.make_qr(content, error=error_correction.lower(), mask=0)
     
-    qr_img = qr.make_image(fill_color="black", back_color="white")
-    qr_img = qr_img.resize((size, size))
+    # Render directly at the module scale that reaches the requested size; ReportLab scales the rest
+    symbol_width = qr.symbol_size(scale=1, border=border)[0]
+    scale = max(1, math.ceil(size / symbol_width))
     
-    return qr_img
+    # Return immutable bytes so cached results can't be modified by callers
+    png_buffer = io.BytesIO()
+    qr.save(png_buffer, kind='png', scale=scale, border=border)
+    return png_buffer.getvalue()
 
 def create_debug_overlay_pdf(data_rows, layout_config):
     """Create PDF overlay with positioning guides for debugging"""
@@ -463,17 +610,72 @@ def create_debug_overlay_pdf(data_rows, layout_config):
     buffer.seek(0)
     return buffer
 
-def create_overlay_pdf(data_rows, layout_config):
-    """Create PDF overlay with text and QR codes for parking passes"""
+def available_cpu_count():
+    """Number of CPUs this process may run on, which can be fewer than the host has"""
+    if hasattr(os, 'sched_getaffinity'):
+        return len(os.sched_getaffinity(0))
+    return os.cpu_count() or 1
+
+def create_overlay_pdf(data_rows, layout_config, background_path=None):
+    """Create PDF overlay for parking passes, rendering large batches in parallel"""
+    cpu_count = available_cpu_count()
+    if len(data_rows) < PARALLEL_PDF_MIN_ROWS or cpu_count < 2:
+        return render_overlay_pdf(data_rows, layout_config, background_path)
+    
+    # Chunks hold an even number of rows so every chunk fills whole pages
+    chunks = [data_rows[i:i + PDF_CHUNK_ROWS] for i in range(0, len(data_rows), PDF_CHUNK_ROWS)]
+    
+    max_workers = min(cpu_count, len(chunks), PARALLEL_PDF_MAX_WORKERS)
+    
+    try:
+        with ProcessPoolExecutor(max_workers=max_workers, mp_context=PDF_MP_CONTEXT) as executor:
+            chunk_buffers = list(executor.map(render_overlay_pdf, chunks,
+                                              itertools.repeat(layout_config),
+                                              itertools.repeat(background_path)))
+    except (OSError, BrokenProcessPool) as e:
+        logging.warning(f"Parallel PDF rendering unavailable, rendering sequentially: {e}")
+        return render_overlay_pdf(data_rows, layout_config, background_path)
+    
+    # Stitch the chunk overlays back together in order
+    writer = pypdf.PdfWriter()
+    for chunk_buffer in chunk_buffers:
+        writer.append(chunk_buffer)
+    
+    # Every chunk embeds its own copy of the template background; keep only one
+    if background_path:
+        writer.compress_identical_objects()
+    
+    buffer = io.BytesIO()
+    writer.write(buffer)
+    buffer.seek(0)
+    return buffer
+
+def render_overlay_pdf(data_rows, layout_config, background_path=None):
+    """Render PDF overlay with text and QR codes for parking passes, optionally on the template background"""
     buffer = io.BytesIO()
     c = canvas.Canvas(buffer, pagesize=letter)
     
     page_width, page_height = letter
     rows_per_page = 2  # Two passes per page
+    qr_images = {}  # QR content -> ImageReader, shared by duplicate passes
+    
+    # Field settings are the same for every pass, so resolve them once
+    conf_config = layout_config['fields']['confirmation']
+    date_config = layout_config['fields']['date']
+    nights_config = layout_config['fields']['nights']
+    qr_config = layout_config['qr']
+    
+    # Track the active font size so setFont is only emitted when it changes
+    current_font_size = None
     
     for page_num, start_idx in enumerate(range(0, len(data_rows), rows_per_page)):
         if page_num > 0:
             c.showPage()
+            current_font_size = None  # showPage resets the graphics state
+        
+        # ReportLab embeds the background image once and references it from every page
+        if background_path:
+            draw_template_background(c, background_path, page_width, page_height)
         
         page_rows = data_rows[start_idx:start_idx + rows_per_page]
         
@@ -486,7 +688,6 @@ def create_overlay_pdf(data_rows, layout_config):
             origin_y = page_height - origin_y
             
             # Draw confirmation number with auto-sizing
-            conf_config = layout_config['fields']['confirmation']
             conf_x = origin_x + conf_config['offset'][0]
             conf_y = origin_y - conf_config['offset'][1]
             
@@ -499,49 +700,47 @@ def create_overlay_pdf(data_rows, layout_config):
             else:
                 font_size = max(8, conf_config['font_size'] - 2)  # Minimum font size of 8
             
-            c.setFont("Helvetica", font_size)
+            if font_size != current_font_size:
+                c.setFont("Helvetica", font_size)
+                current_font_size = font_size
             c.drawString(conf_x, conf_y, confirmation_text)
             
             # Draw date (fill in the blank after "Date")
-            date_config = layout_config['fields']['date']
             date_x = origin_x + date_config['offset'][0]
             date_y = origin_y - date_config['offset'][1]
-            c.setFont("Helvetica", date_config['font_size'])
+            if date_config['font_size'] != current_font_size:
+                c.setFont("Helvetica", date_config['font_size'])
+                current_font_size = date_config['font_size']
             c.drawString(date_x, date_y, str(row_data['arrival']))
             
             # Draw nights (fill in the blank after "Days Staying")
-            nights_config = layout_config['fields']['nights']
             nights_x = origin_x + nights_config['offset'][0]
             nights_y = origin_y - nights_config['offset'][1]
-            c.setFont("Helvetica", nights_config['font_size'])
+            if nights_config['font_size'] != current_font_size:
+                c.setFont("Helvetica", nights_config['font_size'])
+                current_font_size = nights_config['font_size']
             c.drawString(nights_x, nights_y, str(row_data['nights']))
             
             # Generate and draw QR code
-            qr_config = layout_config['qr']
             qr_content = qr_config['content_template'].format(
                 confirmation=row_data['confirmation'],
                 arrival=row_data['arrival'],
                 nights=row_data['nights']
             )
             
-            qr_img = generate_qr_code(qr_content, qr_config['size_px'])
+            # Reuse one ImageReader per QR content so repeats skip PNG decoding
+            if qr_content not in qr_images:
+                qr_png = generate_qr_code(qr_content, qr_config['size_px'],
+                                          qr_config.get('border', 5),
+                                          qr_config.get('error_correction', 'M'))
+                qr_images[qr_content] = ImageReader(io.BytesIO(qr_png))
             
-            # Save QR code to temporary file for ReportLab
-            with tempfile.NamedTemporaryFile(suffix='.png', delete=False) as temp_qr:
-                qr_img.save(temp_qr.name, format='PNG')
-                temp_qr_path = temp_qr.name
+            qr_x = origin_x + qr_config['offset'][0]
+            qr_y = origin_y - qr_config['offset'][1] - qr_config['size_px']
             
-            try:
-                qr_x = origin_x + qr_config['offset'][0]
-                qr_y = origin_y - qr_config['offset'][1] - qr_config['size_px']
-                
-                c.drawImage(temp_qr_path, qr_x, qr_y, 
-                           width=qr_config['size_px'], 
-                           height=qr_config['size_px'])
-            finally:
-                # Clean up temporary QR file
-                if os.path.exists(temp_qr_path):
-                    os.unlink(temp_qr_path)
+            c.drawImage(qr_images[qr_content], qr_x, qr_y, 
+                       width=qr_config['size_px'], 
+                       height=qr_config['size_px'])
     
     c.save()
     buffer.seek(0)
@@ -597,6 +796,76 @@ def start_cleanup_thread():
     cleanup_thread.start()
     logging.info("Started periodic file cleanup thread")
 
+def prepare_template_background(template_path, dpi=TEMPLATE_BACKGROUND_DPI):
+    """Render the first template page to a cached JPEG that ReportLab can embed without re-encoding"""
+    # Cached in the output folder so cleanup_old_files removes backgrounds of replaced templates
+    template_name = os.path.splitext(os.path.basename(template_path))[0]
+    template_mtime = int(os.path.getmtime(template_path))
+    background_path = os.path.join(app.config['OUTPUT_FOLDER'], f"{template_name}_{template_mtime}_{dpi}dpi.jpg")
+    
+    if not os.path.exists(background_path):
+        document = pdfium.PdfDocument(template_path)
+        try:
+            image = document[0].render(scale=dpi / 72).to_pil()
+        finally:
+            document.close()
+        
+        # Write under a temporary name first so concurrent requests never read a partial image
+        fd, temp_path = tempfile.mkstemp(prefix='.background_', suffix='.part', dir=app.config['OUTPUT_FOLDER'])
+        os.close(fd)
+        image.convert('RGB').save(temp_path, 'JPEG', quality=TEMPLATE_BACKGROUND_QUALITY)
+        os.replace(temp_path, background_path)
+        logging.info(f"Rendered template background: {background_path}")
+    
+    return background_path
+
+def draw_template_background(c, background_path, width, height):
+    """Draw the cached template JPEG as the page background"""
+    # Without ASCII85 ReportLab copies the JPEG bytes straight into the PDF instead of encoding them
+    # for every document. rl_config is process-wide, so only switch it off while the image object is built,
+    # under a lock so overlapping requests can't restore each other's temporary value
+    with RL_CONFIG_LOCK:
+        use_a85 = rl_config.useA85
+        rl_config.useA85 = 0
+        try:
+            c.drawImage(background_path, 0, 0, width=width, height=height)
+        finally:
+            rl_config.useA85 = use_a85
+
+def create_template_form(writer, template_page):
+    """Copy a template page into the writer as a reusable form XObject"""
+    template_contents = template_page.get_contents()
+    
+    form = DecodedStreamObject()
+    form.set_data(template_contents.get_data() if template_contents is not None else b'')
+    form.update({
+        NameObject('/Type'): NameObject('/XObject'),
+        NameObject('/Subtype'): NameObject('/Form'),
+        NameObject('/BBox'): RectangleObject(template_page.mediabox),
+        NameObject('/Resources'): template_page[NameObject('/Resources')].clone(writer),
+    })
+    
+    # PdfWriter has no public way to register a standalone stream; pypdf is pinned below 7 for this
+    return writer._add_object(form.flate_encode())
+
+def copy_template_page_settings(writer, template_page, page):
+    """Carry the template page's rotation, transparency group and annotations over to an output page"""
+    for key in ('/Rotate', '/Group'):
+        if key in template_page:
+            page[NameObject(key)] = template_page[key].clone(writer)
+    
+    if '/Annots' not in template_page:
+        return
+    
+    # Annotations belong to a single page, so every page gets its own copies
+    annotations = ArrayObject()
+    for annotation in template_page['/Annots']:
+        annotation = annotation.get_object().clone(writer, force_duplicate=True, ignore_fields=('/P',))
+        annotation[NameObject('/P')] = page.indirect_reference
+        annotations.append(annotation.indirect_reference or writer._add_object(annotation))
+    annotations.extend(page.get('/Annots', ArrayObject()))
+    page[NameObject('/Annots')] = annotations
+
 def merge_pdf_overlay(template_path, overlay_buffer, output_path):
     """Merge overlay PDF with template PDF"""
     try:
@@ -611,41 +880,41 @@ def merge_pdf_overlay(template_path, overlay_buffer, output_path):
         # Reset buffer position to beginning
         overlay_buffer.seek(0)
         
-        # Create temporary file for overlay
-        with tempfile.NamedTemporaryFile(suffix='.pdf', delete=False) as temp_overlay_file:
-            temp_overlay_file.write(overlay_buffer.read())
-            temp_overlay_path = temp_overlay_file.name
+        # Read both PDFs; the overlay is read straight from memory
+        template_reader = pypdf.PdfReader(template_path)
+        overlay_reader = pypdf.PdfReader(overlay_buffer)
+        writer = pypdf.PdfWriter()
         
-        try:
-            # Read both PDFs
-            template_reader = pypdf.PdfReader(template_path)
-            overlay_reader = pypdf.PdfReader(temp_overlay_path)
-            writer = pypdf.PdfWriter()
-            
-            if len(template_reader.pages) == 0:
-                raise ValueError("Template PDF has no pages")
-                
-            template_page = template_reader.pages[0]
-            
-            # Merge each overlay page with the template
-            for overlay_page in overlay_reader.pages:
-                # IMPORTANT: Must read template fresh for each page to avoid accumulation
-                template_reader_fresh = pypdf.PdfReader(template_path)
-                fresh_template_page = template_reader_fresh.pages[0]
-                # Merge the overlay on top of fresh template
-                fresh_template_page.merge_page(overlay_page)
-                writer.add_page(fresh_template_page)
+        if len(template_reader.pages) == 0:
+            raise ValueError("Template PDF has no pages")
             
-            # Write the final PDF
-            with open(output_path, 'wb') as output_file:
-                writer.write(output_file)
+        template_page = template_reader.pages[0]
+        
+        # Decode the template once and share it between all pages as a form XObject
+        template_form = create_template_form(writer, template_page)
+        
+        # Draw the template underneath each overlay page
+        for overlay_page in overlay_reader.pages:
+            page = writer.add_page(overlay_page)
+            page.mediabox = template_page.mediabox
+            page.cropbox = template_page.cropbox
+            copy_template_page_settings(writer, template_page, page)
             
-            logging.info(f"Successfully created merged PDF: {output_path}")
+            resources = page[NameObject('/Resources')]
+            if NameObject('/XObject') not in resources:
+                resources[NameObject('/XObject')] = DictionaryObject()
+            resources[NameObject('/XObject')][NameObject(TEMPLATE_FORM_NAME)] = template_form
             
-        finally:
-            # Clean up temporary file
-            if os.path.exists(temp_overlay_path):
-                os.unlink(temp_overlay_path)
+            contents = ContentStream(None, writer)
+            contents.set_data(f"q {TEMPLATE_FORM_NAME} Do Q\n".encode() + page.get_contents().get_data())
+            page.replace_contents(contents)
+            page.compress_content_streams()
+        
+        # Write the final PDF
+        with open(output_path, 'wb') as output_file:
+            writer.write(output_file)
+        
+        logging.info(f"Successfully created merged PDF: {output_path}")
         
     except Exception as e:
         logging.error(f"Error merging PDFs: {e}")
@@ -653,7 +922,20 @@ def merge_pdf_overlay(template_path, overlay_buffer, output_path):
         logging.error(f"Full traceback: {traceback.format_exc()}")
         raise
 
+def load_session_rows():
+    """Rebuild validated rows for the current upload from its cached table"""
+    filepath = os.path.join(app.config['UPLOAD_FOLDER'], session['current_file'])
+    df = load_cached_table(filepath)
+    return validate_rows(df, session['column_mapping'], load_config())
+
 # Flask routes
+@app.errorhandler(413)
+def file_too_large(e):
+    """Handle uploads larger than MAX_CONTENT_LENGTH"""
+    max_mb = app.config['MAX_CONTENT_LENGTH'] // (1024 * 1024)
+    flash(f'File is too large. Maximum upload size is {max_mb}MB.', 'error')
+    return redirect(url_for('index'))
+
 @app.route('/')
 def index():
     """Main upload and processing page"""
@@ -676,16 +958,20 @@ def upload_file():
         timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
         filename = f"{timestamp}_{filename}"
         filepath = os.path.join(app.config['UPLOAD_FOLDER'], filename)
-        file.save(filepath)
+        
+        # Stream the upload to disk with a fixed-size buffer
+        with open(filepath, 'wb') as dst:
+            shutil.copyfileobj(file.stream, dst, length=UPLOAD_CHUNK_SIZE)
         
         try:
             # Load and process the file
-            df = load_table(filepath)
+            df = load_cached_table(filepath)
             config = load_config()
             column_mapping = auto_map_columns(df, config)
             
             # Store in session for further processing
             session['current_file'] = filename
+            session.pop('data_processed', None)
             session['column_mapping'] = column_mapping
             session['columns'] = df.columns.tolist()
             
@@ -709,7 +995,7 @@ def column_mapping():
     try:
         # Load the file to get data preview
         filepath = os.path.join(app.config['UPLOAD_FOLDER'], session['current_file'])
-        df = load_table(filepath)
+        df = load_cached_table(filepath)
         
         # Get preview data (first 3 non-empty rows for each column)
         column_previews = {}
@@ -752,14 +1038,13 @@ def process_data():
     try:
         # Load file and process data
         filepath = os.path.join(app.config['UPLOAD_FOLDER'], session['current_file'])
-        df = load_table(filepath)
+        df = load_cached_table(filepath)
         config = load_config()
         
         valid_rows, errors = validate_rows(df, column_mapping, config)
         
-        # Store processed data in session
-        session['valid_rows'] = valid_rows
-        session['errors'] = errors
+        # Rows are rebuilt from the cached table, so the session cookie only records that the mapping was applied
+        session['data_processed'] = True
         session['column_mapping'] = column_mapping
         
         flash(f'Data processed: {len(valid_rows)} valid rows, {len(errors)} errors', 'info')
@@ -772,29 +1057,35 @@ def process_data():
 @app.route('/preview')
 def preview_data():
     """Preview processed data before PDF generation"""
-    if 'valid_rows' not in session:
+    if 'data_processed' not in session:
         flash('No processed data available', 'error')
         return redirect(url_for('index'))
     
+    try:
+        valid_rows, errors = load_session_rows()
+    except Exception as e:
+        flash(f'Error loading processed data: {str(e)}', 'error')
+        return redirect(url_for('index'))
+    
     return render_template('preview.html', 
-                         valid_rows=session.get('valid_rows', []),
-                         errors=session.get('errors', []))
+                         valid_rows=valid_rows,
+                         errors=errors)
 
 @app.route('/generate-pdf', methods=['POST'])
 def generate_pdf():
     """Generate parking pass PDF"""
-    if 'valid_rows' not in session:
+    if 'data_processed' not in session:
         flash('No processed data available', 'error')
         return redirect(url_for('index'))
     
     try:
         # Get selected rows (if any specific selection was made)
         selected_indices = request.form.getlist('selected_rows')
-        valid_rows = session['valid_rows']
+        valid_rows, _ = load_session_rows()
         
         if selected_indices:
             # Filter to selected rows only
-            selected_indices = [int(idx) for idx in selected_indices]
+            selected_indices = {int(idx) for idx in selected_indices}
             valid_rows = [row for i, row in enumerate(valid_rows) if i in selected_indices]
         
         if not valid_rows:
@@ -814,16 +1105,31 @@ def generate_pdf():
         logging.info(f"Template exists: {os.path.exists(template_path)}")
         logging.info(f"Output path: {output_path}")
         
-        # Create overlay PDF and merge with template
+        # Draw passes straight onto the pre-rendered template; merging the vector template is the fallback
+        background_path = None
+        background_dpi = layout_config['page'].get('template_background_dpi', TEMPLATE_BACKGROUND_DPI)
+        if background_dpi:
+            try:
+                background_path = prepare_template_background(template_path, background_dpi)
+            except Exception as e:
+                logging.warning(f"Template background unavailable, merging template instead: {e}")
+        
         try:
-            logging.info("Creating overlay PDF...")
-            overlay_buffer = create_overlay_pdf(valid_rows, layout_config)
-            logging.info(f"Overlay created successfully, type: {type(overlay_buffer)}")
-            
-            # Merge with template
-            logging.info("Starting template merge...")
-            merge_pdf_overlay(template_path, overlay_buffer, output_path)
-            logging.info("Template merge completed")
+            if background_path:
+                logging.info("Creating PDF on template background...")
+                pdf_buffer = create_overlay_pdf(valid_rows, layout_config, background_path)
+                with open(output_path, 'wb') as output_file:
+                    output_file.write(pdf_buffer.getvalue())
+                logging.info("PDF created successfully")
+            else:
+                logging.info("Creating overlay PDF...")
+                overlay_buffer = create_overlay_pdf(valid_rows, layout_config)
+                logging.info(f"Overlay created successfully, type: {type(overlay_buffer)}")
+                
+                # Merge with template
+                logging.info("Starting template merge...")
+                merge_pdf_overlay(template_path, overlay_buffer, output_path)
+                logging.info("Template merge completed")
             
         except Exception as e:
             logging.error(f"Error in PDF creation: {e}")
@@ -907,8 +1213,9 @@ def initialize_cleanup():
     except Exception as e:
         logging.error(f"Failed to initialize cleanup system: {e}")
 
-# Initialize cleanup when module is loaded
-initialize_cleanup()
+# Initialize cleanup when module is loaded (but not in PDF rendering worker processes)
+if multiprocessing.parent_process() is None:
+    initialize_cleanup()
 
 if __name__ == '__main__':
     app.run(host='0.0.0.0', port=5000, debug=True)
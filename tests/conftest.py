@@ -0,0 +1,9 @@
+import os
+import sys
+import tempfile
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO_ROOT)
+
+# Importing app creates uploads/output and cleans out old files, so keep that away from the repo
+os.chdir(tempfile.mkdtemp(prefix='parking_pass_tests_'))
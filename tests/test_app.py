@@ -0,0 +1,155 @@
+import os
+
+import numpy as np
+import pandas as pd
+import pypdf
+from pypdf.annotations import Link
+from pypdf.generic import NameObject, NumberObject
+
+import app
+
+
+def write_bytes(tmp_path, name, data):
+    path = tmp_path / name
+    path.write_bytes(data)
+    return str(path)
+
+
+def test_short_cp1252_csv_keeps_rows(tmp_path):
+    path = write_bytes(tmp_path, 'arrivals.csv', 'Conf,Guest\n1,Café\n'.encode('cp1252'))
+    
+    df = app.load_table(path)
+    
+    assert len(df) == 1
+    assert df['Guest'].tolist() == ['Café']
+
+
+def test_cp1252_csv_decodes_umlauts(tmp_path):
+    path = write_bytes(tmp_path, 'arrivals.csv', 'Conf,Guest\n1,"Müller, Jürgen"\n'.encode('cp1252'))
+    
+    df = app.load_table(path)
+    
+    assert df['Guest'].tolist() == ['Müller, Jürgen']
+
+
+def test_utf8_and_bom_csv_detection(tmp_path):
+    utf8_path = write_bytes(tmp_path, 'utf8.csv', 'Conf,Guest\n1,Café\n'.encode('utf-8'))
+    bom_path = write_bytes(tmp_path, 'bom.csv', 'Conf,Guest\n1,Café\n'.encode('utf-8-sig'))
+    
+    assert app.detect_encoding(utf8_path) == 'utf-8'
+    assert app.detect_encoding(bom_path) == 'utf-8-sig'
+    assert app.load_table(bom_path).columns.tolist() == ['Conf', 'Guest']
+
+
+def test_out_of_range_dates_are_invalid_not_fatal():
+    df = pd.DataFrame({
+        'Conf': ['1001', '1002', '1003'],
+        'Arrive': ['09/04/2025', '09/04/0025', '09/04/2025'],
+        'Departs': ['12/31/9999', '09/08/2025', '09/08/2025'],
+    })
+    mapping = {'confirmation': 'Conf', 'arrival': 'Arrive', 'departure': 'Departs'}
+    
+    valid_rows, errors = app.validate_rows(df, mapping, app.get_default_config())
+    
+    assert [row['confirmation'] for row in valid_rows] == ['1003']
+    assert valid_rows[0]['nights'] == 4
+    assert errors[0]['errors'] == ["Invalid departure date format"]
+    assert errors[1]['errors'] == ["Invalid arrival date format"]
+
+
+def test_now_and_today_are_invalid_dates():
+    df = pd.DataFrame({
+        'Conf': ['1001', '1002'],
+        'Arrive': ['now', '09/04/2025'],
+        'Departs': ['12/31/2030', 'Today'],
+    })
+    mapping = {'confirmation': 'Conf', 'arrival': 'Arrive', 'departure': 'Departs'}
+    
+    valid_rows, errors = app.validate_rows(df, mapping, app.get_default_config())
+    
+    assert valid_rows == []
+    assert errors[0]['errors'] == ["Invalid arrival date format"]
+    assert errors[1]['errors'] == ["Invalid departure date format"]
+
+
+def test_numeric_excel_headers_match_read_excel(tmp_path):
+    path = str(tmp_path / 'arrivals.xlsx')
+    pd.DataFrame([['Report', None, None], ['Guest', 2025, 1.5], ['Smith', 3, 2.5]]).to_excel(
+        path, header=False, index=False)
+    raw_df = pd.read_excel(path, header=None)
+    
+    df = app.frame_from_header_row(raw_df, 1)
+    
+    # load_table stringifies column names, so compare them the way it sees them
+    expected = pd.read_excel(path, header=1).columns.astype(str).tolist()
+    assert df.columns.astype(str).tolist() == expected == ['Guest', '2025', '1.5']
+
+
+def test_auto_map_skips_fields_without_aliases():
+    df = pd.DataFrame(columns=['Guest', 'Arrive'])
+    config = {'columns': {'confirmation': [], 'arrival': ['Arrive']}}
+    
+    assert app.auto_map_columns(df, config) == {'arrival': 'Arrive'}
+
+
+def test_merge_keeps_template_page_settings(tmp_path):
+    template_path = str(tmp_path / 'template.pdf')
+    writer = pypdf.PdfWriter(clone_from=os.path.join(os.path.dirname(app.__file__), 'static', 'parking_pass_template.pdf'))
+    writer.pages[0][NameObject('/Rotate')] = NumberObject(90)
+    writer.add_annotation(0, Link(rect=(50, 50, 200, 80), target_page_index=0))
+    writer.write(template_path)
+    rows = [{'confirmation': str(1000 + i), 'arrival': '01/02/2026', 'nights': 2} for i in range(3)]
+    output_path = str(tmp_path / 'passes.pdf')
+    
+    app.merge_pdf_overlay(template_path, app.create_overlay_pdf(rows, app.get_default_layout()), output_path)
+    
+    pages = pypdf.PdfReader(output_path).pages
+    assert [page['/Rotate'] for page in pages] == [90, 90]
+    annotation_refs = [page['/Annots'][0].idnum for page in pages]
+    assert len(set(annotation_refs)) == 2
+    assert '1002' in pages[1].extract_text()
+    assert 'Registered Guest' in pages[1].extract_text()
+
+
+def test_visual_matrix_confirmations_come_from_following_rows():
+    blank = [np.nan] * 4
+    df = pd.DataFrame([
+        ['Smith, Jo', '09/04/2025'] + blank,
+        [np.nan, np.nan, 'Conf:', '123456', np.nan, np.nan],
+        ['Doe, Al', '09/04/2025'] + blank,
+        [np.nan, np.nan, 'Room', '101', np.nan, np.nan],
+        [np.nan] * 6,
+        [np.nan, np.nan, np.nan, 'Conf:', np.nan, '777888'],
+        ['Roe, Bo', '09/05/2025'] + blank,
+        [np.nan, np.nan, 'Conf:', '12', 'Conf:', '98765'],
+        ['Poe, Ed', '09/05/2025'] + blank,
+        [np.nan, np.nan, 'Conf:', '#!', np.nan, np.nan],
+        [np.nan, np.nan, 'Conf:', 'XY-99', np.nan, np.nan],
+        ['Lee, Ann', '09/06/2025'] + blank,
+        [np.nan] * 6,
+        [np.nan] * 6,
+        [np.nan] * 6,
+        [np.nan, np.nan, 'Conf:', '555555', np.nan, np.nan],
+    ], columns=['Guest Name', 'Arrive', 'A', 'B', 'C', 'D'])
+    
+    result = app.process_visual_matrix_format(df)
+    
+    assert result['Guest Name'].tolist() == ['Smith, Jo', 'Doe, Al', 'Roe, Bo', 'Poe, Ed', 'Lee, Ann']
+    assert result['Confirmation'].tolist() == ['123456', '777888', '98765', 'XY-99', 'Not Found']
+    assert result['Arrive'].tolist() == ['09/04/2025', '09/04/2025', '09/05/2025', '09/05/2025', '09/06/2025']
+
+
+def test_excel_header_row_is_found_below_report_title(tmp_path):
+    path = str(tmp_path / 'arrivals.xlsx')
+    pd.DataFrame([
+        ['Arrivals Report', None, None, None, None, None],
+        [None, None, None, None, None, None],
+        ['Name', 'Status', 'Arrive', 'Depart', 'Room', 'Rate'],
+        ['Smith', 'Due In', '09/04/2025', '09/06/2025', 101, 129.0],
+        ['Doe', 'Due In', '09/04/2025', '09/05/2025', 102, 99.0],
+    ]).to_excel(path, header=False, index=False)
+    
+    df = app.load_table(path)
+    
+    assert df.columns.tolist() == ['Name', 'Status', 'Arrive', 'Depart', 'Room', 'Rate']
+    assert df['Name'].tolist() == ['Smith', 'Doe']